@@ -8,23 +8,39 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import requests  
-from bs4 import BeautifulSoup 
+import re
+import codecs
+from itertools import chain
+import lxml.html
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor
 from doi_manager import DOIManager 
+from http_utils import create_session, NO_CACHE_HEADERS
+from html_utils import detect_encoding
 import pandas as pd 
 from tqdm import tqdm  
 
+# DOI syntax: the "10." prefix, a registrant code of 4 to 9 digits and a suffix
+_DOI_RE = re.compile(r'10\.\d{4,9}/\S+')
+
 class DOIFinder:
     """
     A class to find and extract DOI links from the entity viewer of the OpenCitations Website.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=20, cache_name="http_cache"):
         """
         Initialize the DOIFinder class.
+
+        Args:
+            max_workers (int): Maximum number of entity pages fetched concurrently.
+            cache_name (str): Path of the SQLite cache of the journal pages, or None to disable caching.
+                The entity pages are streamed, so they are not cached.
         """
         self.doi_manager = DOIManager() 
         self.complete_resource = []  
+        self.max_workers = max_workers
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name)
 
     def doi_to_url(self, doi):
         """
@@ -42,7 +58,7 @@ class DOIFinder:
         url = self.doi_to_url(doi)
         try:
             # Send a GET request to the DOI URL
-            response = requests.get(url)
+            response = self.session.get(url)
             if response.status_code == 200:
                 return response.text  # Return the page content if the request is successful
             else:
@@ -58,17 +74,17 @@ class DOIFinder:
         """
         try:
             # Make an HTTP request to the initial URL
-            initial_response = requests.get(initial_url, timeout=10)
+            initial_response = self.session.get(initial_url, timeout=10)
             
             if initial_response.status_code != 200:
                 print(f"Error accessing initial page: {initial_response.status_code}")
                 return []  # Return an empty list if the request fails
 
-            # Parse the HTML content using BeautifulSoup
-            soup = BeautifulSoup(initial_response.content, 'html.parser')
+            # Parse the HTML content directly with lxml, only the <a> tags are needed here
+            tree = lxml.html.fromstring(initial_response.content)
             
             # Find all <a> tags in the HTML (links)
-            identifier_links = soup.find_all('a')
+            identifier_links = tree.iter('a')
 
             # Filter and clean the links that potentially contain DOIs
             doi_links = self.id_checker(identifier_links)
@@ -98,9 +114,72 @@ class DOIFinder:
         print("Found DOI links.")
         return new_list
 
+    def _extract_li_elements(self, link):
+        """
+        Stream the page of a link and return the text of its <li> elements containing DOIs, or None if the request fails.
+        The page is parsed while it is downloaded and each <li> is discarded once read, so the full DOM is never kept in memory.
+
+        """
+        try:
+            # The page bypasses the cache, which would download it whole before it could be streamed
+            with self.session.get(link, timeout=10, stream=True, headers=NO_CACHE_HEADERS) as response:
+                if response.status_code != 200:
+                    return None
+
+                chunks = response.iter_content(chunk_size=32768)
+                first_chunk = next(chunks, b'')
+                parser, decode = self._create_li_parser(response, first_chunk)
+                li_texts = []
+                for chunk in chain([first_chunk], chunks):
+                    parser.feed(decode(chunk))
+                    self._collect_li_texts(parser, li_texts)
+                parser.feed(decode(b'', final=True))
+                parser.close()
+                self._collect_li_texts(parser, li_texts)
+                return li_texts
+        except Exception as e:
+            print(f"Error accessing page {link}: {e}")
+        return None
+
+    @staticmethod
+    def _create_li_parser(response, first_chunk):
+        """
+        Create the pull parser of the <li> elements of a page, with the charset of the response or, if it has none,
+        the encoding detected from the first chunk, since lxml alone reads undeclared pages as Latin-1.
+        Returns the parser and the function preparing each chunk to be fed to it.
+
+        """
+        # requests falls back on Latin-1 for text responses without a charset, so its encoding is only used when declared
+        charset = response.encoding if 'charset' in response.headers.get('Content-Type', '').lower() else None
+        encoding = detect_encoding(first_chunk, charset)
+        try:
+            return etree.HTMLPullParser(events=('end',), tag='li', encoding=encoding), lambda chunk, final=False: chunk
+        except LookupError:
+            # lxml doesn't know every codec Python does (e.g. mac-roman), so the chunks are decoded before being fed
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            return etree.HTMLPullParser(events=('end',), tag='li'), decoder.decode
+
+    @staticmethod
+    def _collect_li_texts(parser, li_texts):
+        """
+        Read the <li> elements completed by the parser, keep the ones containing a DOI and free the others.
+
+        """
+        for _, li in parser.read_events():
+            text = ''.join(li.itertext())
+            if _DOI_RE.search(text):
+                li_texts.append(''.join(part.strip() for part in li.itertext()))
+
+            # Nested <li> elements are still needed by the text of their parent
+            if next(li.iterancestors('li'), None) is None:
+                li.clear(keep_tail=True)
+                while li.getprevious() is not None:
+                    del li.getparent()[0]
+
     def li_link_analyser(self, list_of_id_links):
         """
         Analyze links and extract <li> elements containing DOIs.
+        The pages are fetched concurrently, at most max_workers at a time so the website is not flooded with requests.
 
         Args:
             list_of_id_links (list): List of DOI-related links.
@@ -109,24 +188,15 @@ class DOIFinder:
             list: A list of extracted DOI-related content.
         """
         extracted_content = []
-        for link in list_of_id_links:
-            try:
-                # Access each DOI link and parse its content
-                response = requests.get(link, timeout=10)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    
-                    # Find all <li> elements in the page
-                    li_elements = soup.find_all('li')
-                    
-                    # Extract text from <li> elements that contain '10.' (DOI prefix)
-                    filtered_li_elements = [li.get_text(strip=True) for li in li_elements if '10.' in li.get_text()]
-                    
-                    # Append the extracted content
-                    extracted_content.extend(filtered_li_elements)
-                    self.complete_resource.append(extracted_content)
-            except Exception as e:
-                print(f"Error accessing page {link}: {e}")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Results are returned in the same order as the links
+            for filtered_li_elements in executor.map(self._extract_li_elements, list_of_id_links):
+                if filtered_li_elements is None:
+                    continue
+                
+                # Append the extracted content
+                extracted_content.extend(filtered_li_elements)
+                self.complete_resource.append(extracted_content)
         return extracted_content
 
 
@@ -8,113 +8,223 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+import diskcache
+import duckdb
+import orjson
 import pandas as pd
-from SPARQLWrapper import SPARQLWrapper, JSON
+from http_utils import create_session, chunked
+from doi_utils import normalize_url
+
+# Characters that can't appear inside a SPARQL IRI reference
+IRI_FORBIDDEN_CHARS = re.compile(r'[\x00-\x20<>"{}|^`\\]')
 
 class SPARQLCitationExtractor:
     """
     A class to extract citation and cited entity data using the OpenCitations Index SPARQL endpoint.
     """
-    def __init__(self, endpoint_url, input_csv_path, output_directory):
+    def __init__(self, endpoint_url, input_csv_path, output_directory, batch_size=50, cache_directory="sparql_cache", cache_expire=86400, max_workers=4):
         """
         Initializes the SPARQLCitationExtractor with the endpoint URL, input CSV, and output directory.
+        The entities are queried in batches of batch_size URLs per query, and the results are cached in cache_directory
+        for cache_expire seconds (pass cache_directory=None to disable the cache).
+        At most max_workers queries are sent to the endpoint at the same time.
         """
         self.endpoint_url = endpoint_url
         self.input_csv_path = input_csv_path
         self.output_directory = output_directory
+        self.batch_size = batch_size
+        self.cache = diskcache.Cache(cache_directory) if cache_directory else None
+        self.cache_expire = cache_expire
+        self.max_workers = max_workers
+        self.session = create_session(pool_maxsize=max_workers)
+
+    def _run_query(self, query):
+        """
+        Runs a query on the SPARQL endpoint and returns its bindings.
+        The bindings are cached by the hash of the normalized query, so a repeated query doesn't reach the endpoint again.
+        """
+        normalized_query = " ".join(query.split())
+        key = hashlib.sha1(f"{self.endpoint_url} {normalized_query}".encode("utf-8")).hexdigest()
+        if self.cache is not None:
+            bindings = self.cache.get(key)
+            if bindings is not None:
+                return bindings
+
+        # Queries are posted as form data, since batched queries can be too long for a GET URL
+        response = self.session.post(
+            self.endpoint_url,
+            data={'query': query},
+            headers={'Accept': 'application/sparql-results+json'},
+            timeout=60
+        )
+        response.raise_for_status()
+        bindings = orjson.loads(response.content)['results']['bindings']
+
+        if self.cache is not None:
+            self.cache.set(key, bindings, expire=self.cache_expire)
+        return bindings
+
+    @staticmethod
+    def _format_iri(url):
+        """
+        Formats a URL as a SPARQL IRI, percent-encoding the characters that would break the query.
+        """
+        return "<" + IRI_FORBIDDEN_CHARS.sub(lambda match: "".join(f"%{byte:02X}" for byte in match.group().encode("utf-8")), url) + ">"
+
+    def _query_batch(self, urls, query_template, key):
+        """
+        Runs a batched query for several entity URLs, whose IRIs replace {values} in query_template.
+        Returns a dict mapping each URL to its bindings, grouped by the value of the variable key.
+        If the batch fails, the URLs are queried one at a time so that a single bad URL doesn't lose the whole batch,
+        and the URLs whose query fails again are left out of the result.
+        """
+        iris = {self._format_iri(url): url for url in urls}
+        query = query_template.format(values=" ".join(iris))
+        try:
+            bindings = self._run_query(query)
+        except Exception as e:
+            print(f"Error querying {', '.join(urls)}: {e}")
+            if len(urls) == 1:
+                return None
+            grouped = {}
+            for url in urls:
+                results = self._query_batch([url], query_template, key)
+                if results is not None:
+                    grouped[url] = results.get(url, [])
+            return grouped
+
+        grouped = {}
+        for binding in bindings:
+            value = binding[key]['value']
+            # Map the returned IRI back to the URL it was queried with
+            url = iris.get(self._format_iri(value), value)
+            grouped.setdefault(url, []).append(binding)
+        return grouped
 
     def query_sparql_citing(self, cited_entity_url):
         """
         Queries the SPARQL endpoint for citing entities of a given cited entity.
         """
-        sparql = SPARQLWrapper(self.endpoint_url)
-        query = f"""
+        results = self.query_sparql_citing_batch([cited_entity_url])
+        return None if results is None else results.get(cited_entity_url, [])
+
+    def query_sparql_citing_batch(self, cited_entity_urls):
+        """
+        Queries the SPARQL endpoint for citing entities of several cited entities with a single query.
+        Returns a dict mapping each cited entity URL to its bindings.
+        """
+        query_template = """
         PREFIX cito:<http://purl.org/spar/cito/>
-        SELECT ?citation ?citing_entity WHERE {{
+        SELECT ?cited_entity ?citation ?citing_entity WHERE {{
+            VALUES ?cited_entity {{ {values} }}
             ?citation a cito:Citation .
             ?citation cito:hasCitingEntity ?citing_entity .
-            ?citation cito:hasCitedEntity <{cited_entity_url}>
+            ?citation cito:hasCitedEntity ?cited_entity
         }}
         """
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        try:
-            results = sparql.query().convert()
-            return results['results']['bindings']
-        except Exception as e:
-            print(f"Error querying {cited_entity_url}: {e}")
-            return None
+        return self._query_batch(cited_entity_urls, query_template, 'cited_entity')
 
     def query_sparql_cited(self, citing_entity_url):
         """
         Queries the SPARQL endpoint for cited entities of a given citing entity.
         """
-        sparql = SPARQLWrapper(self.endpoint_url)
-        query = f"""
+        results = self.query_sparql_cited_batch([citing_entity_url])
+        return None if results is None else results.get(citing_entity_url, [])
+
+    def query_sparql_cited_batch(self, citing_entity_urls):
+        """
+        Queries the SPARQL endpoint for cited entities of several citing entities with a single query.
+        Returns a dict mapping each citing entity URL to its bindings.
+        """
+        query_template = """
         PREFIX cito:<http://purl.org/spar/cito/>
-        SELECT ?citation ?cited_entity WHERE {{
+        SELECT ?citing_entity ?citation ?cited_entity WHERE {{
+            VALUES ?citing_entity {{ {values} }}
             ?citation a cito:Citation .
             ?citation cito:hasCitedEntity ?cited_entity .
-            ?citation cito:hasCitingEntity <{citing_entity_url}>
+            ?citation cito:hasCitingEntity ?citing_entity
         }}
         """
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        try:
-            results = sparql.query().convert()
-            return results['results']['bindings']
-        except Exception as e:
-            print(f"Error querying {citing_entity_url}: {e}")
-            return None
+        return self._query_batch(citing_entity_urls, query_template, 'citing_entity')
 
-    def extract_citing_data(self):
+    def _load_journal_urls(self):
         """
-        Extracts citing entity data from the SPARQL endpoint and saves it to a CSV file.
+        Loads the journal URLs from the input CSV, normalized and without duplicates so each entity is queried only once.
         """
         journal_column = pd.read_csv(self.input_csv_path, usecols=['journal'])
-        citations_list = []
-
-        for journal_url in journal_column['journal']:
-            sparql_results = self.query_sparql_citing(journal_url)
+        journal_urls = (normalize_url(url) for url in journal_column['journal'].dropna().tolist())
+        return list(dict.fromkeys(url for url in journal_urls if url))
 
-            if sparql_results:
-                for result in sparql_results:
-                    citation = result.get('citation', {}).get('value', '')
-                    citing_entity = result.get('citing_entity', {}).get('value', '')
-                    citations_list.append({'journal': journal_url, 'citation': citation, 'citing_entity': citing_entity})
+    def extract_citing_data(self):
+        """
+        Extracts citing entity data from the SPARQL endpoint and saves it to a Parquet file.
+        """
+        citations_list = []
 
-        results_df = pd.DataFrame(citations_list)
-        results_df.to_csv(f"{self.output_directory}/sparql_results.csv", index=False)
-        print("Citing entities data saved to sparql_results.csv")
+        # The batches are queried concurrently, the results are returned in the same order as the batches
+        batches = list(chunked(self._load_journal_urls(), self.batch_size))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for journal_urls, batch_results in zip(batches, executor.map(self.query_sparql_citing_batch, batches)):
+                if batch_results:
+                    for journal_url in journal_urls:
+                        for result in batch_results.get(journal_url, []):
+                            citation = result.get('citation', {}).get('value', '')
+                            citing_entity = result.get('citing_entity', {}).get('value', '')
+                            citations_list.append({'journal': journal_url, 'citation': citation, 'citing_entity': citing_entity})
+
+        # Intermediate results are stored as Parquet, which is smaller and faster to read back than CSV
+        results_df = pd.DataFrame(citations_list, columns=['journal', 'citation', 'citing_entity'])
+        results_df.to_parquet(f"{self.output_directory}/sparql_results.parquet", engine='pyarrow', compression='zstd', index=False)
+        print("Citing entities data saved to sparql_results.parquet")
 
     def extract_cited_data(self):
         """
-        Extracts cited entity data from the SPARQL endpoint and saves it to a CSV file.
+        Extracts cited entity data from the SPARQL endpoint and saves it to a Parquet file.
         """
-        journal_column = pd.read_csv(self.input_csv_path, usecols=['journal'])
         citations_cited_list = []
 
-        for journal_url in journal_column['journal']:
-            sparql_results = self.query_sparql_cited(journal_url)
-
-            if sparql_results:
-                for result in sparql_results:
-                    citation = result.get('citation', {}).get('value', '')
-                    cited_entity = result.get('cited_entity', {}).get('value', '')
-                    citations_cited_list.append({'journal': journal_url, 'citation': citation, 'cited_entity': cited_entity})
-
-        results_df = pd.DataFrame(citations_cited_list)
-        results_df.to_csv(f"{self.output_directory}/sparql_results_cited.csv", index=False)
-        print("Cited entities data saved to sparql_results_cited.csv")
+        # The batches are queried concurrently, the results are returned in the same order as the batches
+        batches = list(chunked(self._load_journal_urls(), self.batch_size))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for journal_urls, batch_results in zip(batches, executor.map(self.query_sparql_cited_batch, batches)):
+                if batch_results:
+                    for journal_url in journal_urls:
+                        for result in batch_results.get(journal_url, []):
+                            citation = result.get('citation', {}).get('value', '')
+                            cited_entity = result.get('cited_entity', {}).get('value', '')
+                            citations_cited_list.append({'journal': journal_url, 'citation': citation, 'cited_entity': cited_entity})
+
+        results_df = pd.DataFrame(citations_cited_list, columns=['journal', 'citation', 'cited_entity'])
+        results_df.to_parquet(f"{self.output_directory}/sparql_results_cited.parquet", engine='pyarrow', compression='zstd', index=False)
+        print("Cited entities data saved to sparql_results_cited.parquet")
 
     def merge_citing_and_cited_data(self):
         """
         Merges citing and cited entity data into a single CSV file.
+        The join runs in DuckDB, which reads the Parquet files directly and streams the merged rows to the CSV file,
+        sorted by journal so the output order doesn't depend on how the join is parallelized.
         """
-        citing_df = pd.read_csv(f"{self.output_directory}/sparql_results.csv")
-        cited_df = pd.read_csv(f"{self.output_directory}/sparql_results_cited.csv")
-        merged_df = pd.merge(citing_df, cited_df, on="journal", how="outer", suffixes=('citing', 'cited'))
-        merged_df.to_csv(f"{self.output_directory}/all_citations.csv", index=False)
+        # Paths are embedded in the SQL as string literals, so their single quotes are escaped
+        citing_path = f"{self.output_directory}/sparql_results.parquet".replace("'", "''")
+        cited_path = f"{self.output_directory}/sparql_results_cited.parquet".replace("'", "''")
+        output_path = f"{self.output_directory}/all_citations.csv".replace("'", "''")
+
+        with duckdb.connect() as con:
+            con.execute(f"""
+                COPY (
+                    SELECT journal,
+                           citing.citation AS citationciting,
+                           citing.citing_entity,
+                           cited.citation AS citationcited,
+                           cited.cited_entity
+                    FROM read_parquet('{citing_path}') AS citing
+                    FULL OUTER JOIN read_parquet('{cited_path}') AS cited USING (journal)
+                    ORDER BY journal
+                ) TO '{output_path}' (FORMAT CSV, HEADER)
+            """)
         print("Citing and cited data merged and saved to all_citations.csv")
 
 #To use:
@@ -8,19 +8,22 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import json
+import orjson
 import requests
 import csv
-import time
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import pandas as pd
+from http_utils import create_session, chunked, RateLimiter
+from io_utils import JSONObjectWriter
+from doi_utils import normalize_doi
 
 class CrossRefProcessor:
     """
     A class to handle fetching, processing, and filtering metadata from the CrossRef API.
     """
     
-    def __init__(self, input_csv, output_json, output_csv, filtered_json):
+    def __init__(self, input_csv, output_json, output_csv, filtered_json, mailto=None, max_workers=5, requests_per_second=10, batch_size=50, cache_name="http_cache"):
         """
         Initializes the processor with file paths.
         
@@ -29,11 +32,21 @@ class CrossRefProcessor:
             output_json (str): Path to save the output JSON file.
             output_csv (str): Path to save the output CSV file.
             filtered_json (str): Path to save the filtered JSON file.
+            mailto (str): Contact email sent to CrossRef to be served by its polite pool.
+            max_workers (int): Maximum number of concurrent requests to the CrossRef API.
+            requests_per_second (int): Maximum number of requests sent to the CrossRef API each second.
+            batch_size (int): Number of DOIs looked up with a single request to the CrossRef API, kept low to stay under the URI length limit.
+            cache_name (str): Path of the SQLite cache of the CrossRef responses, or None to disable caching.
         """
         self.input_csv = input_csv
         self.output_json = output_json
         self.output_csv = output_csv
         self.filtered_json = filtered_json
+        self.mailto = mailto
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name)
+        self.rate_limiter = RateLimiter(requests_per_second)  # Shared by all the workers to avoid rate-limiting
 
     def get_crossref_data(self, doi):
         """
@@ -41,82 +54,114 @@ class CrossRefProcessor:
 
         """
         url = f"https://api.crossref.org/works/{doi}"
+        params = {"mailto": self.mailto} if self.mailto else None
         try:
-            response = requests.get(url)
+            self.rate_limiter.wait()
+            response = self.session.get(url, params=params)
             response.raise_for_status()
-            data = response.json().get('message', {})
-            
-            title = data.get("title", [""])[0] if data.get("title") else "No Title Available"
-            publisher = data.get("publisher", "")
-            issue = data.get("issue", "")
-            date_time = data.get("created", {}).get("date-time", "")
-            authors = [f"{author.get('given', '')} {author.get('family', '')}" for author in data.get("author", [])]
-            references = data.get("reference", [])
-            
-            return {
-                "doi": doi,
-                "title": title,
-                "publisher": publisher,
-                "issue": issue,
-                "date_time": date_time,
-                "authors": "; ".join(authors),
-                "references": references
-            }
-        except requests.RequestException as e:
+            data = orjson.loads(response.content).get('message', {})
+            # Use the DOI as written by CrossRef, like the batch lookups do
+            return self._parse_crossref_item(data.get("DOI", doi), data)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             print(f"Error fetching CrossRef data for DOI {doi}: {e}")
             return {}
 
+    def get_crossref_batch(self, dois):
+        """
+        Fetch metadata for a batch of DOIs with a single request to the CrossRef API.
+        Returns a dict mapping each lowercased DOI found by CrossRef to its metadata.
+        If the batch request fails, the DOIs are looked up one at a time so that a single bad DOI doesn't lose the whole batch.
+
+        """
+        params = {
+            "filter": ",".join(f"doi:{doi}" for doi in dois),
+            "rows": len(dois),
+            "select": "DOI,title,publisher,issue,created,author,reference"
+        }
+        if self.mailto:
+            params["mailto"] = self.mailto
+        try:
+            self.rate_limiter.wait()
+            response = self.session.get("https://api.crossref.org/works", params=params)
+            response.raise_for_status()
+            items = orjson.loads(response.content).get('message', {}).get('items', [])
+            return {item["DOI"].lower(): self._parse_crossref_item(item["DOI"], item) for item in items}
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            print(f"Error fetching CrossRef data for DOIs {', '.join(dois)}, retrying them one at a time: {e}")
+            return {doi.lower(): self.get_crossref_data(doi) for doi in dois}
+
+    @staticmethod
+    def _parse_crossref_item(doi, data):
+        """
+        Extract the metadata used by the processor from a CrossRef work.
+
+        """
+        title = data.get("title", [""])[0] if data.get("title") else "No Title Available"
+        publisher = data.get("publisher", "")
+        issue = data.get("issue", "")
+        date_time = data.get("created", {}).get("date-time", "")
+        authors = [f"{author.get('given', '')} {author.get('family', '')}" for author in data.get("author", [])]
+        references = data.get("reference", [])
+        
+        return {
+            "doi": doi,
+            "title": title,
+            "publisher": publisher,
+            "issue": issue,
+            "date_time": date_time,
+            "authors": "; ".join(authors),
+            "references": references
+        }
+
+    def _iter_crossref_data(self, dois):
+        """
+        Fetch metadata for DOIs in concurrent batches, yielding (doi, metadata) pairs in the same order as the DOIs.
+
+        """
+        batches = list(chunked(dois, self.batch_size))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch, crossref_batch in zip(batches, executor.map(self.get_crossref_batch, batches)):
+                for doi in batch:
+                    yield doi, crossref_batch.get(doi.lower(), {})
+
     def process_data(self):
         """
         Fetch metadata for DOIs from a CSV file and save the results as JSON and CSV.
         """
-        # Load DOIs from the input CSV file
+        # Load DOIs from the input CSV file, normalized so that each DOI is requested only once
         df = pd.read_csv(self.input_csv, usecols=["doi_citing_entity"])
+        dois = df["doi_citing_entity"].dropna().map(normalize_doi).unique().tolist()
         
-        references_data = {}
-        csv_rows = []
-        
-        for _, row in tqdm(df.iterrows(), desc="Processing entries", total=df.shape[0]):
-            primary_doi = row["doi_citing_entity"]
-            crossref_data = self.get_crossref_data(primary_doi)
-            
-            if crossref_data:
-                # Store references data in JSON format
-                references_data[primary_doi] = {
-                    "doi": primary_doi,
-                    "referenced_entities": crossref_data.get("references", [])
-                }
-                
-                # Prepare data for the CSV file
-                csv_row = {
-                    "primary_id": primary_doi,
-                    "id": crossref_data.get("doi", ""),
-                    "title": crossref_data.get("title", ""),
-                    "author": crossref_data.get("authors", ""),
-                    "pub_date": crossref_data.get("date_time", ""),
-                    "venue": "",
-                    "volume": crossref_data.get("volume", ""),
-                    "issue": crossref_data.get("issue", ""),
-                    "page": "",
-                    "type": "",
-                    "publisher": crossref_data.get("publisher", ""),
-                    "editor": ""
-                }
-                csv_rows.append(csv_row)
-                
-                # Sleep to avoid rate-limiting
-                time.sleep(0.1)
-        
-        # Save results to JSON
-        with open(self.output_json, "w", encoding="utf-8") as jsonfile:
-            json.dump(references_data, jsonfile, ensure_ascii=False, indent=4)
-        
-        # Save results to CSV
+        # Save results to JSON and CSV while they are fetched, so they are never held in memory
         fieldnames = ["primary_id", "id", "title", "author", "pub_date", "venue", "volume", "issue", "page", "type", "publisher", "editor"]
-        with open(self.output_csv, "w", newline="", encoding="utf-8") as csvfile:
+        with JSONObjectWriter(self.output_json) as json_writer, open(self.output_csv, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(csv_rows)
+            
+            for primary_doi, crossref_data in tqdm(self._iter_crossref_data(dois), desc="Processing entries", total=len(dois)):
+                if crossref_data:
+                    # Store references data in JSON format
+                    json_writer.write(primary_doi, {
+                        "doi": primary_doi,
+                        "referenced_entities": crossref_data.get("references", [])
+                    })
+                    
+                    # Prepare data for the CSV file
+                    csv_row = {
+                        "primary_id": primary_doi,
+                        "id": crossref_data.get("doi", ""),
+                        "title": crossref_data.get("title", ""),
+                        "author": crossref_data.get("authors", ""),
+                        "pub_date": crossref_data.get("date_time", ""),
+                        "venue": "",
+                        "volume": crossref_data.get("volume", ""),
+                        "issue": crossref_data.get("issue", ""),
+                        "page": "",
+                        "type": "",
+                        "publisher": crossref_data.get("publisher", ""),
+                        "editor": ""
+                    }
+                    writer.writerow(csv_row)
         
         print(f"Data saved to {self.output_json} and {self.output_csv}")
 
@@ -125,8 +170,8 @@ class CrossRefProcessor:
         Filter the referenced DOIs from the metadata JSON file and save to a new JSON file.
         """
         # Load the JSON data from the output file
-        with open(self.output_json, "r", encoding="utf-8") as json_file:
-            data = json.load(json_file)
+        with open(self.output_json, "rb") as json_file:
+            data = orjson.loads(json_file.read())
         
         # Initialize a new dictionary to store the filtered results
         filtered_data = {}
@@ -140,8 +185,8 @@ class CrossRefProcessor:
                     filtered_data[doi]["referenced_dois"].append(entity["DOI"])
         
         # Save the filtered results to a new JSON file
-        with open(self.filtered_json, "w", encoding="utf-8") as output_file:
-            json.dump(filtered_data, output_file, ensure_ascii=False, indent=4)
+        with open(self.filtered_json, "wb") as output_file:
+            output_file.write(orjson.dumps(filtered_data, option=orjson.OPT_INDENT_2))
         
         print(f"Filtered data saved to {self.filtered_json}")
 
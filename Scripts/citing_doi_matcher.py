@@ -8,9 +8,16 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
 from tqdm import tqdm
-import json
+import ijson
+import re
+from doi_utils import DOI_PREFIXES
+
+# Matches the resolver or "doi:" prefix at the start of an already lowercased DOI
+DOI_PREFIX_PATTERN = "^(?:" + "|".join(re.escape(prefix) for prefix in DOI_PREFIXES) + ")"
 
 class DOIMatcher:
     """
@@ -35,63 +42,101 @@ class DOIMatcher:
         Load and preprocess the CSV file.
 
         Returns:
-            set: A set of DOIs from the CSV file after cleaning.
+            pyarrow.Array: The unique DOIs from the CSV file after cleaning.
         """
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(self.csv_file, quotechar='"', engine='python')
-
-        # Clean the 'id' column by removing the "doi:" prefix
-        df["id"] = df["id"].str.replace("doi:", "", regex=False)
-
-        # Convert the DOIs into a set for quick lookup
-        doi_set = set(df["id"].dropna())
+        # Read only the 'id' column with the multithreaded PyArrow reader, quoted values can span several lines
+        table = pacsv.read_csv(
+            self.csv_file,
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(include_columns=["id"], column_types={"id": pa.string()}, strings_can_be_null=True)
+        )
+
+        # Clean the 'id' column with the same normalization of the referenced DOIs
+        ids = self._normalize_dois(table["id"].drop_null())
+
+        # Keep the unique DOIs as an Arrow array, used as the lookup set of the matching
+        doi_set = pc.unique(ids)
         return doi_set
 
-    def load_json(self):
+    def iter_json(self):
         """
-        Load the JSON file containing DOI references.
+        Stream the entries of the JSON file containing DOI references, without loading the whole file in memory.
 
-        Returns:
-            dict: Parsed JSON data.
+        Yields:
+            tuple: The DOI of an entry and its data.
         """
-        with open(self.json_file, 'r', encoding='utf-8') as json_file:
-            data = json.load(json_file)
-        return data
+        with open(self.json_file, 'rb') as json_file:
+            yield from ijson.kvitems(json_file, '')
 
-    def match_dois(self, doi_set, json_data):
+    def match_dois(self, doi_set, json_entries, chunk_size=100000):
         """
         Match DOIs from the JSON file against those in the CSV file.
+        The (citing, referenced) pairs are collected in chunks of chunk_size and each chunk is matched with a vectorized Arrow lookup.
 
         Args:
-            doi_set (set): A set of DOIs from the CSV file.
-            json_data (dict): The parsed JSON data.
+            doi_set (pyarrow.Array): The DOIs from the CSV file.
+            json_entries (iterable): The (DOI, data) entries of the JSON file.
+            chunk_size (int): Number of pairs matched at once.
 
         Returns:
-            list: A list of matched DOI pairs [citing_doi, referenced_doi].
+            pyarrow.Table: Matched DOI pairs [citing_doi, referenced_doi].
         """
-        results = []
+        matched_tables = []
+        citing_dois = []
+        referenced_dois = []
 
         # Iterate through the JSON data
-        for entry_doi, entry_data in tqdm(json_data.items(), desc="Processing JSON entries"):
-            for referenced_doi in entry_data.get('referenced_dois', []):
-                # Check if the referenced DOI exists in the CSV-derived set
-                if referenced_doi in doi_set:
-                    results.append([entry_doi, referenced_doi])
+        for entry_doi, entry_data in tqdm(json_entries, desc="Processing JSON entries"):
+            entry_references = entry_data.get('referenced_dois', [])
+            citing_dois.extend([entry_doi] * len(entry_references))
+            referenced_dois.extend(entry_references)
+
+            # Match the pairs collected so far to keep memory bounded
+            if len(referenced_dois) >= chunk_size:
+                matched_tables.append(self._match_pairs(doi_set, citing_dois, referenced_dois))
+                citing_dois = []
+                referenced_dois = []
+
+        matched_tables.append(self._match_pairs(doi_set, citing_dois, referenced_dois))
+        return pa.concat_tables(matched_tables)
+
+    @staticmethod
+    def _normalize_dois(dois):
+        """
+        Normalize an Arrow array of DOIs as doi_utils.normalize_doi does: trim, lowercase and strip the resolver or "doi:" prefix.
+
+        Returns:
+            pyarrow.Array: The normalized DOIs.
+        """
+        dois = pc.utf8_lower(pc.utf8_trim_whitespace(dois))
+        return pc.replace_substring_regex(dois, DOI_PREFIX_PATTERN, "", max_replacements=1)
 
-        return results
+    @staticmethod
+    def _match_pairs(doi_set, citing_dois, referenced_dois):
+        """
+        Keep the pairs whose referenced DOI exists in the CSV-derived set.
+
+        Returns:
+            pyarrow.Table: The matched pairs.
+        """
+        citing_array = pa.array(citing_dois, type=pa.string())
+        referenced_array = pa.array(referenced_dois, type=pa.string())
+        # The lookup uses the normalized DOIs, while the output keeps them as written in the JSON file
+        mask = pc.is_in(DOIMatcher._normalize_dois(referenced_array), value_set=doi_set)
+        return pa.Table.from_arrays(
+            [citing_array.filter(mask), referenced_array.filter(mask)],
+            names=['doi_of_citing_entity', 'doi_of_referenced_matched']
+        )
 
     def save_results(self, results):
         """
         Save the matched DOIs to a CSV file.
 
         Args:
-            results (list): Matched DOI pairs.
+            results (pyarrow.Table): Matched DOI pairs.
         """
-        # Convert results to a DataFrame
-        results_df = pd.DataFrame(results, columns=['doi_of_citing_entity', 'doi_of_referenced_matched'])
-
-        # Save the DataFrame to a CSV file
-        results_df.to_csv(self.output_file, index=False)
+        # Write the Arrow table directly, without converting it to a DataFrame
+        pacsv.write_csv(results, self.output_file)
 
         print(f"Matched DOIs saved to {self.output_file}")
 
@@ -102,11 +147,9 @@ class DOIMatcher:
         print("Loading CSV data...")
         doi_set = self.load_csv()
 
-        print("Loading JSON data...")
-        json_data = self.load_json()
-
         print("Matching DOIs...")
-        results = self.match_dois(doi_set, json_data)
+        # The JSON entries are streamed while they are matched
+        results = self.match_dois(doi_set, self.iter_json())
 
         print(f"Total matches found: {len(results)}")
 
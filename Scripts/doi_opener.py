@@ -8,30 +8,98 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import csv
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_utils import create_session
 
 class DOIOpener:
-    def __init__(self, batch_data):
+    def __init__(self, batch_data, max_workers=20):
         self.batch_data = batch_data
+        self.max_workers = max_workers  # Maximum number of DOIs checked concurrently
+        self.session = create_session(pool_maxsize=max_workers)
+        self.doi_status = {}  # HTTP status returned by doi.org for each checked DOI
+
+    @staticmethod
+    def parse_entry(entry):
+        """
+        Split an entry of the doi list into its base URL and its list of DOIs.
+        """
+        # The first item in the entry is the base URL
+        base_url = entry[0].strip().strip('"')
+        
+        # The second item is a long string of DOIs separated by commas
+        dois = [doi.strip() for doi in entry[1].strip().strip('"').split(',')]
+        return base_url, dois
+
+    def check_doi(self, doi):
+        """
+        Ask doi.org to resolve a DOI without following the redirect, and return the HTTP status (None if the request fails).
+        A registered DOI is answered with a redirect to its landing page, an unknown one with 404.
+        """
+        try:
+            response = self.session.head("https://doi.org/" + doi, allow_redirects=False, timeout=10)
+            return response.status_code
+        except requests.RequestException as e:
+            print(f"Error checking DOI {doi}: {e}")
+            return None
+
+    @staticmethod
+    def is_valid(status):
+        """
+        Tell whether a status returned by check_doi belongs to a DOI that resolves.
+        """
+        return status is not None and status < 400
+
+    def check_dois(self):
+        """
+        Check all the DOIs of the doi list concurrently and store their status in doi_status.
+        """
+        dois = list(dict.fromkeys(doi for entry in self.batch_data for doi in self.parse_entry(entry)[1]))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.doi_status = dict(zip(dois, executor.map(self.check_doi, dois)))
+        return self.doi_status
+
+    def save_invalid_dois(self, output_csv):
+        """
+        Save the DOIs that doi.org can't resolve to a CSV file, together with their base URL and status.
+        """
+        if not self.doi_status:
+            self.check_dois()
+
+        with open(output_csv, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["base_url", "doi", "status"])
+            for entry in self.batch_data:
+                base_url, dois = self.parse_entry(entry)
+                for doi in dois:
+                    status = self.doi_status.get(doi)
+                    if not self.is_valid(status):
+                        writer.writerow([base_url, doi, status])
+        print(f"Invalid DOIs saved to {output_csv}")
     
     def process_and_open_urls(self):
         """
         Process each entry in the doi list and open the corresponding URLs and DOIs to check the dois for validation.
+        The DOIs are resolved first, so only the ones that exist are opened for the manual check.
         """
+        if not self.doi_status:
+            self.check_dois()
+
         for entry in self.batch_data:
-            # The first item in the entry is the base URL
-            base_url = entry[0].strip().strip('"')
-            
-            # The second item is a long string of DOIs separated by commas
-            dois = entry[1].strip().strip('"').split(',')
+            base_url, dois = self.parse_entry(entry)
             
             # Open the base URL in the web browser
             webbrowser.open(base_url)
             
-            # Open each DOI link
+            # Open each DOI link that resolves, and report the others
             for doi in dois:
-                full_doi_url = "https://doi.org/" + doi.strip()
-                webbrowser.open(full_doi_url)
+                status = self.doi_status.get(doi)
+                if self.is_valid(status):
+                    webbrowser.open("https://doi.org/" + doi)
+                else:
+                    print(f"DOI {doi} of {base_url} does not resolve (status: {status})")
 
 if __name__ == "__main__":
     # Insert the list of dois here
@@ -39,4 +107,5 @@ if __name__ == "__main__":
 
 
     doi_opener = DOIOpener(doi_list)
+    doi_opener.save_invalid_dois("insert_file_path")
     doi_opener.process_and_open_urls()
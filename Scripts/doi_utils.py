@@ -0,0 +1,34 @@
+# Copyright (c) 2024 Salvatore Di Marzo
+
+# Permission to use, copy, modify, and/or distribute this software for any purpose with or without fee is hereby granted,
+# provided that the above copyright notice and this permission notice appear in all copies.
+
+# THE SOFTWARE IS PROVIDED “AS IS” AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
+# NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+# Prefixes that can precede a DOI in the input files
+DOI_PREFIXES = ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:")
+
+
+def normalize_doi(doi):
+    """
+    Normalize a DOI so that the same DOI written in different ways is only processed once.
+    The DOI is stripped of whitespace and of its resolver or "doi:" prefix, and lowercased since DOIs are case-insensitive.
+
+    """
+    doi = doi.strip().lower()
+    for prefix in DOI_PREFIXES:
+        if doi.startswith(prefix):
+            return doi[len(prefix):]
+    return doi
+
+
+def normalize_url(url):
+    """
+    Normalize an entity URL by stripping whitespace and the trailing slash.
+    The case is kept, since the path of a URL is case-sensitive.
+
+    """
+    return url.strip().rstrip('/')
@@ -0,0 +1,64 @@
+# Copyright (c) 2024 Salvatore Di Marzo
+
+# Permission to use, copy, modify, and/or distribute this software for any purpose with or without fee is hereby granted,
+# provided that the above copyright notice and this permission notice appear in all copies.
+
+# THE SOFTWARE IS PROVIDED “AS IS” AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
+# NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import lxml.html
+from lxml import etree
+from bs4.dammit import EncodingDetector
+
+# Text nodes of an element, leaving out scripts and styles like BeautifulSoup's get_text
+TEXT_XPATH = etree.XPath(".//text()[not(parent::script or parent::style)]")
+
+
+def detect_encoding(content, known_encoding=None):
+    """
+    Pick the encoding of an HTML page as BeautifulSoup would, without decoding it: the known encoding if given
+    (e.g. the charset of the HTTP response), then a byte order mark, the declared charset, the detected one and UTF-8.
+    The content can also be just the beginning of the page.
+
+    """
+    detector = EncodingDetector(content, known_definite_encodings=[known_encoding] if known_encoding else None, is_html=True)
+    encoding = next(detector.encodings)
+    # A beginning in plain ASCII says nothing about the rest of the page, and UTF-8 reads ASCII the same way
+    return 'utf-8' if encoding.lower() == 'ascii' else encoding
+
+
+def parse_html(content):
+    """
+    Parse an HTML page with lxml.
+    Bytes are parsed with the encoding BeautifulSoup would detect, since lxml alone reads undeclared pages as Latin-1.
+
+    """
+    if isinstance(content, bytes) and content.strip():
+        encoding = detect_encoding(content)
+        try:
+            # A parser is created for each page since lxml parsers can't be shared between threads
+            return lxml.html.fromstring(content, parser=lxml.html.HTMLParser(encoding=encoding))
+        except LookupError:
+            # lxml doesn't know every codec Python does (e.g. mac-roman), so the page is decoded here instead.
+            # It is passed back as UTF-8 bytes since lxml rejects strings that carry an XML encoding declaration
+            text = content.decode(encoding, errors='replace')
+            return lxml.html.fromstring(text.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+    return lxml.html.fromstring(content)
+
+
+def get_text(element):
+    """
+    Return the text of an lxml element with each piece stripped of whitespace, like BeautifulSoup's get_text(strip=True).
+
+    """
+    return "".join(text.strip() for text in TEXT_XPATH(element))
+
+
+def class_xpath(class_name):
+    """
+    Return an XPath predicate matching the elements that have the given class among their classes, like BeautifulSoup's class_ argument.
+
+    """
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
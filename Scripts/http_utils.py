@@ -0,0 +1,107 @@
+# Copyright (c) 2024 Salvatore Di Marzo
+
+# Permission to use, copy, modify, and/or distribute this software for any purpose with or without fee is hereby granted,
+# provided that the above copyright notice and this permission notice appear in all copies.
+
+# THE SOFTWARE IS PROVIDED “AS IS” AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
+# NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import threading
+import time
+from datetime import timedelta
+from itertools import islice
+import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+
+USER_AGENT = "doi-corrector/1.0"
+
+# DOI pages and their metadata rarely change, so their cached responses are kept longer than the default
+METADATA_CACHE_EXPIRATION = timedelta(days=90)
+
+# Request headers that keep a response out of the cache. A cached session reads the whole body to store it,
+# so they are sent with the streamed requests whose body is processed while it is downloaded
+NO_CACHE_HEADERS = {"Cache-Control": "no-store"}
+
+
+def create_session(pool_connections=32, pool_maxsize=64, cache_name=None, expire_after=timedelta(days=7)):
+    """
+    Create a requests session that keeps connections alive between requests to the same host.
+    If a cache name is given, successful responses are also stored in a SQLite cache so that later runs don't download them again.
+    Requests sent with NO_CACHE_HEADERS bypass the cache.
+
+    Args:
+        pool_connections (int): Number of hosts whose connection pools are kept.
+        pool_maxsize (int): Maximum number of connections open to each host, further requests wait for a free connection.
+        cache_name (str): Path of the SQLite cache, or None to disable caching.
+        expire_after (timedelta): How long a cached response is reused before being fetched again.
+
+    Returns:
+        requests.Session: A session with pooled connections and automatic retries.
+    """
+    if cache_name:
+        # Honor the Cache-Control headers of the server and fall back on stale responses if a request fails
+        session = CachedSession(
+            cache_name,
+            backend="sqlite",
+            expire_after=expire_after,
+            allowable_codes=(200,),
+            stale_if_error=True,
+            cache_control=True
+        )
+    else:
+        session = requests.Session()
+
+    # Retry failed requests and throttled or server error responses with an increasing delay between attempts,
+    # the last response is returned as it is if all the attempts fail
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+    # Block instead of opening throwaway connections when all the pooled ones are busy
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size items, to send them in batched requests.
+
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class RateLimiter:
+    """
+    A thread-safe limiter that spaces out calls so that at most max_calls happen in each period.
+    """
+
+    def __init__(self, max_calls, period=1.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_calls (int): Maximum number of calls allowed in each period.
+            period (float): Length of the period in seconds.
+        """
+        self.interval = period / max_calls
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next call is allowed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            # Book the next free slot before releasing the lock
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,85 @@
+# Copyright (c) 2024 Salvatore Di Marzo
+
+# Permission to use, copy, modify, and/or distribute this software for any purpose with or without fee is hereby granted,
+# provided that the above copyright notice and this permission notice appear in all copies.
+
+# THE SOFTWARE IS PROVIDED “AS IS” AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES
+# OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT,
+# OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
+# NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+
+import orjson
+
+# Options used to encode every value, matching orjson.dumps(data, option=orjson.OPT_INDENT_2) for the whole file
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+INDENT = b"  "
+
+
+class _JSONContainerWriter:
+    """
+    Base class of the writers that stream the items of a JSON container to a file, so the whole container is never held in memory.
+    """
+    opening = b""
+    closing = b""
+
+    def __init__(self, output_file):
+        """
+        Initialize the writer with the path of the output file.
+
+        """
+        self.output_file = output_file
+        self._file = None
+        self._count = 0
+
+    def __enter__(self):
+        self._file = open(self.output_file, 'wb')
+        self._file.write(self.opening)
+        return self
+
+    def _write_item(self, encoded_item):
+        """
+        Write an already encoded item of the container.
+
+        """
+        separator = b",\n" if self._count else b"\n"
+        # Nested lines are shifted by one level since the item is inside the container
+        self._file.write(separator + INDENT + encoded_item.replace(b"\n", b"\n" + INDENT))
+        self._count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The container is only closed if every item was written, so an interrupted run doesn't leave a file that looks complete
+        if exc_type is None:
+            self._file.write(b"\n" + self.closing if self._count else self.closing)
+        self._file.close()
+
+
+class JSONObjectWriter(_JSONContainerWriter):
+    """
+    A context manager that writes a JSON object to a file one key at a time.
+    The file has the same content that orjson.dumps(data, option=orjson.OPT_INDENT_2) would produce.
+    """
+    opening = b"{"
+    closing = b"}"
+
+    def write(self, key, value):
+        """
+        Write a key of the object and its value.
+
+        """
+        self._write_item(orjson.dumps(str(key)) + b": " + orjson.dumps(value, option=JSON_OPTIONS))
+
+
+class JSONArrayWriter(_JSONContainerWriter):
+    """
+    A context manager that writes a JSON array to a file one item at a time.
+    The file has the same content that orjson.dumps(data, option=orjson.OPT_INDENT_2) would produce.
+    """
+    opening = b"["
+    closing = b"]"
+
+    def write(self, value):
+        """
+        Append an item to the array.
+
+        """
+        self._write_item(orjson.dumps(value, option=JSON_OPTIONS))
@@ -9,8 +9,27 @@
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 import requests
-from bs4 import BeautifulSoup
-import json
+from lxml import etree
+from lxml.etree import ParserError
+import orjson
+import os
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http_utils import create_session, METADATA_CACHE_EXPIRATION
+from io_utils import JSONObjectWriter
+from html_utils import parse_html, get_text, class_xpath
+
+# XPath expressions compiled once and reused for every page
+TITLE_XPATH = etree.XPath("//title")
+AUTHOR_META_XPATH = etree.XPath("//meta[@name='citation_author']")
+META_XPATH = etree.XPath("//meta")
+MSO_PARAGRAPH_XPATH = etree.XPath(f"//p[{class_xpath('MsoNormal')}]")
+BOLD_XPATH = etree.XPath(".//*[self::b or self::strong]")
+REFERENCES_H2_XPATH = etree.XPath("//h2[contains(normalize-space(.), 'References')]")
+# Every <p> and <div> after the references heading, in document order
+REFERENCES_WALK_XPATH = etree.XPath("descendant::*[self::p or self::div] | following::*[self::p or self::div]")
 
 class MetadataGatherer:
 
@@ -19,12 +38,17 @@ class MetadataGatherer:
     Use it by changing the tags that need to be retrieved based on the ones found in the article viewer you want to retrieve metadat from.
     """
 
-    def __init__(self, dois):
+    def __init__(self, dois, max_workers=16, cache_name="http_cache", parse_workers=None):
         """
-        Initialize the processor with a list of DOIs.
+        Initialize the processor with a list of DOIs, each kept once since it is a key of the output object.
+        At most max_workers DOI pages are downloaded at the same time, and they are cached in the cache_name SQLite file (None disables caching).
+        The pages are parsed by parse_workers processes, one per CPU by default.
 
         """
-        self.dois = dois
+        self.dois = list(dict.fromkeys(dois))
+        self.max_workers = max_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name, expire_after=METADATA_CACHE_EXPIRATION)
 
     @staticmethod
     def extract_metadata_from_html(content):
@@ -32,42 +56,50 @@ class MetadataGatherer:
         Extract metadata such as title, authors, bold text, and references from the HTML content.
 
         """
-        soup = BeautifulSoup(content, 'html.parser')
+        try:
+            tree = parse_html(content)
+        except ParserError:
+            # The page has no markup to parse
+            return {
+                "title": "No Title Found",
+                "authors": "No Authors Found",
+                "bold_text": "No Bold Text Found",
+                "references": []
+            }
 
         # Extract title
-        title_tag = soup.find('title')
-        title = title_tag.get_text(strip=True) if title_tag else "No Title Found"
+        title_tags = TITLE_XPATH(tree)
+        title = get_text(title_tags[0]) if title_tags else "No Title Found"
 
         # Extract authors
-        author_meta = soup.find('meta', {'name': 'citation_author'})
-        if author_meta:
-            authors = author_meta.get('content', "No Authors Found")
+        author_metas = AUTHOR_META_XPATH(tree)
+        if author_metas:
+            authors = author_metas[0].get('content', "No Authors Found")
         else:
             authors = "No Authors Found"
-            for meta in soup.find_all('meta'):
-                if 'author' in str(meta).lower():
+            for meta in META_XPATH(tree):
+                if any('author' in part.lower() for attribute in meta.attrib.items() for part in attribute):
                     authors = meta.get('content', "No Authors Found")
                     break
 
         # Extract bold text
-        p_tag = soup.find('p', class_='MsoNormal')
+        p_tags = MSO_PARAGRAPH_XPATH(tree)
         bold_text = "No Bold Text Found"
-        if p_tag:
-            bold_tag = p_tag.find(['b', 'strong'])
-            if bold_tag:
-                bold_text = bold_tag.get_text(strip=True)
+        if p_tags:
+            bold_tags = BOLD_XPATH(p_tags[0])
+            if bold_tags:
+                bold_text = get_text(bold_tags[0])
 
         # Extract references
         references = []
-        reference_h2 = soup.find('h2', string=lambda s: s and 'References' in s.strip())
-        if reference_h2:
-            next_tag = reference_h2.find_next()
-            while next_tag:
-                if next_tag.name == 'div':  
+        reference_h2s = REFERENCES_H2_XPATH(tree)
+        if reference_h2s:
+            # The paragraphs and divs after the heading are collected in document order in a single query
+            for next_tag in REFERENCES_WALK_XPATH(reference_h2s[0]):
+                if next_tag.tag == 'div':
                     break
-                if next_tag.name == 'p' and 'MsoNormal' in next_tag.get('class', []):
-                    references.append(next_tag.get_text(strip=True))
-                next_tag = next_tag.find_next()
+                if 'MsoNormal' in next_tag.get('class', '').split():
+                    references.append(get_text(next_tag))
 
         # Compile metadata into a dictionary
         data = {
@@ -84,38 +116,83 @@ class MetadataGatherer:
         Save data to a JSON file.
 
         """
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
         print(f"Data saved to {output_file}")
 
-    def process_dois(self, output_file="metadata_output.json"):
+    def fetch_doi_page(self, doi):
         """
-        Process the list of DOIs, extract metadata, and save the results to a JSON file.
+        Request the DOI page content, returning a (content, error) tuple where only one of the two is set.
 
         """
-        all_metadata = {}
+        doi_url = f"https://doi.org/{doi}"
+        try:
+            response = self.session.get(doi_url, timeout=10)
+            response.raise_for_status()
+            return response.content, None
+        except requests.RequestException as e:
+            return None, str(e)
 
-        for doi in self.dois:
-            doi_url = f"https://doi.org/{doi}"
-            try:
-                # Request the DOI page content
-                response = requests.get(doi_url, timeout=10)
-                response.raise_for_status()
+    def process_dois(self, output_file="metadata_output.json"):
+        """
+        Process the list of DOIs, extract metadata, and save the results to a JSON file.
+        The pages are downloaded concurrently while the ones already received are parsed in separate processes,
+        and the metadata of each DOI is written as soon as it is extracted.
 
-                # Extract metadata
-                metadata = self.extract_metadata_from_html(response.content)
+        """
+        dois = iter(self.dois)
+        # DOIs whose page is being downloaded, in order, with the future of their download
+        downloads = deque()
+        # DOIs whose page was downloaded, in order, with the future of their parsing or the download error
+        parses = deque()
+        # Only a few pages per worker are downloaded or parsed ahead of the ones written, so the pages are never all held in memory
+        max_downloads = self.max_workers * 2
+        max_parses = self.parse_workers * 4
+
+        # The parsing processes are spawned rather than forked, since forking a process running download threads can deadlock
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn")) as parse_executor, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                JSONObjectWriter(output_file) as json_writer:
+            for doi in islice(dois, max_downloads):
+                downloads.append((doi, executor.submit(self.fetch_doi_page, doi)))
+
+            while downloads:
+                doi, download = downloads.popleft()
+                content, error = download.result()
+
+                # Start the next download now that this page has left the download window
+                for next_doi in islice(dois, 1):
+                    downloads.append((next_doi, executor.submit(self.fetch_doi_page, next_doi)))
+
+                if error is None:
+                    # Extract metadata in a parsing process
+                    parses.append((doi, parse_executor.submit(self.extract_metadata_from_html, content), None))
+                else:
+                    parses.append((doi, None, error))
+
+                while len(parses) > max_parses:
+                    self.write_result(json_writer, *parses.popleft())
+
+            while parses:
+                self.write_result(json_writer, *parses.popleft())
 
-                # Save metadata to the dictionary
-                all_metadata[doi] = metadata
-                print(f"Metadata extracted for DOI: {doi}")
+        print(f"Data saved to {output_file}")
 
-            except requests.RequestException as e:
-                # Handle errors gracefully
-                print(f"Error accessing DOI {doi}: {e}")
-                all_metadata[doi] = {"error": str(e)}
+    @staticmethod
+    def write_result(json_writer, doi, future, error):
+        """
+        Save the metadata extracted for a DOI, or its download error, to the JSON file.
 
-        # Save all metadata to a JSON file
-        self.save_to_json(all_metadata, output_file)
+        """
+        if error is not None:
+            # Handle errors gracefully
+            print(f"Error accessing DOI {doi}: {error}")
+            json_writer.write(doi, {"error": error})
+            return
+
+        # Save metadata to the JSON file
+        json_writer.write(doi, future.result())
+        print(f"Metadata extracted for DOI: {doi}")
 
 
 if __name__ == "__main__":
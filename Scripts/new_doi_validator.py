@@ -8,14 +8,27 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import requests
-import json
+import sys
+import orjson
+import ijson
 from tqdm import tqdm
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+from http_utils import create_session, chunked, RateLimiter, METADATA_CACHE_EXPIRATION, NO_CACHE_HEADERS
+
+# CrossRef fields used to validate the DOIs, the rest of the metadata is skipped while parsing
+CROSSREF_FIELDS = ("DOI", "title", "author", "publisher")
+# Position of each field in the JSON response of a single work
+CROSSREF_WORK_PREFIXES = {f"message.{field}": field for field in CROSSREF_FIELDS}
 
 class DOIValidator:
-    def __init__(self, doi_list):
-        self.doi_list = doi_list
+    def __init__(self, doi_list, mailto=None, max_workers=16, crossref_requests_per_second=10, crossref_batch_size=50, cache_name="http_cache"):
+        self.doi_list = list(dict.fromkeys(doi_list))  # Each DOI is validated once, keeping the input order
+        self.mailto = mailto  # Contact email sent to CrossRef to be served by its polite pool
+        self.max_workers = max_workers  # Maximum number of requests sent concurrently
+        self.crossref_rate_limiter = RateLimiter(crossref_requests_per_second)  # Shared by all the workers to avoid being rate-limited by CrossRef
+        self.crossref_batch_size = crossref_batch_size  # DOIs per CrossRef request, kept low to stay under the URI length limit
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name, expire_after=METADATA_CACHE_EXPIRATION)
         self.opencitations_base_url = "https://opencitations.net/meta/api/v1/metadata/doi:"
         self.crossref_base_url = "https://api.crossref.org/works/"
         self.results = []
@@ -23,76 +36,166 @@ class DOIValidator:
     def get_opencitations_metadata(self, doi):
         """Retrieve metadata from OpenCitations API for a given DOI."""
         try:
-            response = requests.get(self.opencitations_base_url + doi)
+            response = self.session.get(self.opencitations_base_url + doi)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             if data:
                 return data[0]  # Access the first item in the OpenCitations response
         except Exception as e:
             print(f"Error fetching OpenCitations data for DOI {doi}: {e}")
         return None
 
+    @staticmethod
+    def stream_json(response):
+        """Parse a JSON response while it is downloaded, yielding its ijson (prefix, event, value) events."""
+        events = ijson.sendable_list()
+        parser = ijson.parse_coro(events, use_float=True)
+        for chunk in response.iter_content(chunk_size=65536):
+            parser.send(chunk)
+            yield from events
+            del events[:]
+        parser.close()
+        yield from events
+
+    @staticmethod
+    def build_fields(events, prefixes):
+        """Build the values found at the given prefixes from a stream of ijson events, keyed by the name mapped to their prefix.
+        The values anywhere else are skipped without being built."""
+        fields = {}
+        for prefix, event, value in events:
+            if prefix not in prefixes:
+                continue
+            if event in ("start_map", "start_array"):
+                # Build the container from its events, up to its end at the same prefix
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                for inner_prefix, event, value in events:
+                    builder.event(event, value)
+                    if inner_prefix == prefix and event in ("end_map", "end_array"):
+                        break
+                value = builder.value
+            fields[prefixes[prefix]] = value
+        return fields
+
     def get_crossref_metadata(self, doi):
         """Retrieve metadata from CrossRef API for a given DOI."""
+        params = {"mailto": self.mailto} if self.mailto else None
         try:
-            response = requests.get(self.crossref_base_url + doi)
-            response.raise_for_status()
-            data = response.json()
-            if "message" in data:
-                return data["message"]  # Access CrossRef metadata in "message"
+            self.crossref_rate_limiter.wait()
+            # The full work is streamed, so it bypasses the cache which would download it whole first
+            with self.session.get(self.crossref_base_url + doi, params=params, stream=True, headers=NO_CACHE_HEADERS) as response:
+                response.raise_for_status()
+                # Only the fields used for validation are built, the rest of the work (e.g. its reference list) is skipped
+                data = self.build_fields(self.stream_json(response), CROSSREF_WORK_PREFIXES)
+            if data:
+                return data
         except Exception as e:
             print(f"Error fetching CrossRef data for DOI {doi}: {e}")
         return None
 
+    def get_crossref_metadata_batch(self, doi_chunk):
+        """Retrieve metadata from CrossRef API for a chunk of DOIs with a single request, keyed by lowercased DOI.
+        If the request fails, the DOIs are looked up one at a time so that a single bad DOI doesn't fail the whole chunk."""
+        params = {
+            "filter": ",".join(f"doi:{doi}" for doi in doi_chunk),
+            "rows": len(doi_chunk),
+            "select": ",".join(CROSSREF_FIELDS)
+        }
+        if self.mailto:
+            params["mailto"] = self.mailto
+        try:
+            self.crossref_rate_limiter.wait()
+            response = self.session.get(self.crossref_base_url.rstrip("/"), params=params)
+            response.raise_for_status()
+            # Only the selected fields are returned, so the response is small enough to be read whole and cached
+            return {item["DOI"].lower(): item for item in orjson.loads(response.content)["message"]["items"]}
+        except Exception as e:
+            print(f"Error fetching CrossRef data for DOIs {', '.join(doi_chunk)}, retrying them one at a time: {e}")
+        crossref_metadata = {}
+        for doi in doi_chunk:
+            data = self.get_crossref_metadata(doi)
+            if data:
+                crossref_metadata[doi.strip().lower()] = data
+        return crossref_metadata
+
     def validate_doi(self, doi, opencitations_data, crossref_data):
-        """Compare metadata between OpenCitations and CrossRef to validate DOI."""
-        # Extract title and author from OpenCitations data
-        opencitations_title = opencitations_data.get("title", "").lower()
-        opencitations_author = opencitations_data.get("author", "").lower()
-        opencitations_publisher = opencitations_data.get("publisher", "").lower()
-        
-        # Extract title, author, and publisher from CrossRef data
-        crossref_title = crossref_data.get("title", [""])[0].lower() if crossref_data.get("title") else ""
-        crossref_author = ", ".join([author["given"] + " " + author["family"] for author in crossref_data.get("author", [])]).lower()
-        crossref_publisher = crossref_data.get("publisher", "").lower()
-        
-        # Validation checks for title, author, and publisher
+        """Compare metadata between OpenCitations and CrossRef to validate DOI.
+        A title match is enough to validate the DOI, so authors and publishers are only compared, and otherwise left as None, when the titles differ."""
+        # Local aliases of the lookups repeated below
+        opencitations_get = opencitations_data.get
+        crossref_get = crossref_data.get
+
+        # Extract title from OpenCitations and CrossRef data, casefolded for a case-insensitive comparison
+        opencitations_title = opencitations_get("title", "").casefold()
+        crossref_titles = crossref_get("title")
+        crossref_title = crossref_titles[0].casefold() if crossref_titles else ""
         title_match = opencitations_title == crossref_title
-        author_match = opencitations_author in crossref_author if opencitations_author else True
-        publisher_match = opencitations_publisher == crossref_publisher
 
-        # Return a validation result
-        return {
+        # Validation result, with the author and publisher checks still to be done
+        result = {
             "doi": doi,
             "opencitations_title": opencitations_title,
             "crossref_title": crossref_title,
             "title_match": title_match,
+            "opencitations_author": None,
+            "crossref_author": None,
+            "author_match": None,
+            "opencitations_publisher": None,
+            "crossref_publisher": None,
+            "publisher_match": None,
+            "valid": title_match
+        }
+        if title_match:
+            return result
+
+        # Extract author and publisher from OpenCitations data
+        opencitations_author = opencitations_get("author", "").casefold()
+        # Publishers repeat across many DOIs, so a single copy of each is kept in the results
+        opencitations_publisher = sys.intern(opencitations_get("publisher", "").casefold())
+        
+        # Extract author and publisher from CrossRef data
+        crossref_author = ", ".join(f"{author['given']} {author['family']}" for author in crossref_get("author") or ()).casefold()
+        crossref_publisher = sys.intern(crossref_get("publisher", "").casefold())
+        
+        # Validation checks for author and publisher
+        author_match = opencitations_author in crossref_author if opencitations_author else True
+        publisher_match = opencitations_publisher == crossref_publisher
+
+        result.update({
             "opencitations_author": opencitations_author,
             "crossref_author": crossref_author,
             "author_match": author_match,
             "opencitations_publisher": opencitations_publisher,
             "crossref_publisher": crossref_publisher,
             "publisher_match": publisher_match,
-            "valid": title_match or (author_match and publisher_match)
-        }
+            "valid": author_match and publisher_match
+        })
+        return result
 
     def validate_doi_list(self):
         """Validate all DOIs in the provided list and store results."""
-        for doi in tqdm(self.doi_list, desc="Validating DOIs"):
-            # Retrieve metadata from both APIs
-            opencitations_data = self.get_opencitations_metadata(doi)
-            crossref_data = self.get_crossref_metadata(doi)
-
-            # Check if data was successfully retrieved from both sources
-            if opencitations_data and crossref_data:
-                # Compare metadata and validate DOI
-                validation_result = self.validate_doi(doi, opencitations_data, crossref_data)
-                self.results.append(validation_result)
-            else:
-                self.results.append({
-                    "doi": doi,
-                    "error": "Data retrieval failed for one or both APIs"
-                })
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Retrieve CrossRef metadata in chunks and OpenCitations metadata per DOI, all concurrently
+            crossref_batches = executor.map(self.get_crossref_metadata_batch, chunked(self.doi_list, self.crossref_batch_size))
+            opencitations_metadata = executor.map(self.get_opencitations_metadata, self.doi_list)
+
+            # Join the CrossRef results by DOI
+            crossref_metadata = {}
+            for batch in crossref_batches:
+                crossref_metadata.update(batch)
+
+            for doi, opencitations_data in tqdm(zip(self.doi_list, opencitations_metadata), desc="Validating DOIs", total=len(self.doi_list)):
+                crossref_data = crossref_metadata.get(doi.strip().lower())
+                # Check if data was successfully retrieved from both sources
+                if opencitations_data and crossref_data:
+                    # Compare metadata and validate DOI
+                    validation_result = self.validate_doi(doi, opencitations_data, crossref_data)
+                    self.results.append(validation_result)
+                else:
+                    self.results.append({
+                        "doi": doi,
+                        "error": "Data retrieval failed for one or both APIs"
+                    })
     def open_dois(self):
         base_url = "https://doi.org/"
         for doi in doi_list:
@@ -103,8 +206,8 @@ class DOIValidator:
 
     def save_results(self, output_file="doi_validation_results.json"):
         """Save validation results to a JSON file."""
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(self.results, f, indent=4)
+        with open(output_file, "wb") as f:
+            f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
         print(f"Validation results saved to {output_file}")
 
 
@@ -8,11 +8,12 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import pandas as pd
-import json
+import orjson
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from http_utils import create_session, METADATA_CACHE_EXPIRATION
 
 
 class JournalIdentifierExtractor:
@@ -20,13 +21,16 @@ class JournalIdentifierExtractor:
     A class to extract identifiers from journals urls and save them to a JSON file.
     """
 
-    def __init__(self, csv_path, output_path):
+    def __init__(self, csv_path, output_path, max_workers=16, cache_name="http_cache"):
         """
         Initialize the extractor with input and output paths.
+        At most max_workers journals are processed at the same time, and the pages are cached in the cache_name SQLite file (None disables caching).
 
         """
         self.csv_path = csv_path
         self.output_path = output_path
+        self.max_workers = max_workers
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name, expire_after=METADATA_CACHE_EXPIRATION)
         self.results = {}  # Dictionary to store extraction results
         self.journal_urls = self._load_journal_urls()  # Load journal URLs from the CSV file
 
@@ -38,12 +42,32 @@ class JournalIdentifierExtractor:
         """
         try:
             # Read the CSV file and extract the 'journal' column as a list
-            journal_doi_df = pd.read_csv(self.csv_path, usecols=['journal'])
-            return journal_doi_df['journal'].tolist()
+            journal_doi_df = pd.read_csv(self.csv_path, usecols=['journal'], dtype='string')
+            journal_urls = journal_doi_df['journal'].str.strip()
+            # Skip the empty or missing URLs, and process each journal once
+            return journal_urls[journal_urls.notna() & journal_urls.ne('')].drop_duplicates().tolist()
         except Exception as e:
             print(f"Error loading CSV file: {e}")
             return []
 
+    @staticmethod
+    def find_definition(tree, label):
+        """
+        Find the <dd> tag that follows the "bg-info" <dt> tag whose text is the given label.
+
+
+        """
+        for dt_tag in tree.css('dt.bg-info'):
+            if dt_tag.text() == label:
+                # Walk the following siblings, skipping text nodes, until the <dd> tag
+                node = dt_tag.next
+                while node is not None:
+                    if node.tag == 'dd':
+                        return node
+                    node = node.next
+                return None
+        return None
+
     def get_identifiers_from_journal(self, url):
         """
         Access the given journal URL and extract related identifiers.
@@ -53,21 +77,19 @@ class JournalIdentifierExtractor:
         identifiers = []
         try:
             # Send a GET request to the journal URL
-            response = requests.get(url)
+            response = self.session.get(url)
             response.raise_for_status()  # Raise an error for HTTP status codes >= 400
-            soup = BeautifulSoup(response.text, 'html.parser')  # Parse the HTML content
+            tree = LexborHTMLParser(response.text)  # Parse the HTML content
 
             # Locate the "identifier" section in the page
-            identifier_section = soup.find('dt', class_="bg-info", string="identifier")
+            identifier_section = self.find_definition(tree, "identifier")
             if identifier_section:
                 # Find the associated <ul> tag containing identifiers
-                ul_tag = identifier_section.find_next_sibling('dd').find(
-                    'ul', rel="http://purl.org/spar/datacite/hasIdentifier"
-                )
+                ul_tag = identifier_section.css_first('ul[rel="http://purl.org/spar/datacite/hasIdentifier"]')
                 if ul_tag:
                     # Collect all links within the <ul> tag
-                    for link in ul_tag.find_all('a'):
-                        identifier_url = link.get('href')  # Get the 'href' attribute of the <a> tag
+                    for link in ul_tag.css('a'):
+                        identifier_url = link.attributes.get('href')  # Get the 'href' attribute of the <a> tag
                         identifiers.append(identifier_url)  # Append the link to the list
         except Exception as e:
             # Log errors encountered while processing the journal URL
@@ -82,59 +104,65 @@ class JournalIdentifierExtractor:
         """
         try:
             # Send a GET request to the identifier URL
-            response = requests.get(identifier_url)
+            response = self.session.get(identifier_url)
             response.raise_for_status()  # Raise an error for HTTP status codes >= 400
-            soup = BeautifulSoup(response.text, 'html.parser')  # Parse the HTML content
+            tree = LexborHTMLParser(response.text)  # Parse the HTML content
 
             # Locate the "id" section in the page
-            id_section = soup.find('dt', class_="bg-info", string="id")
+            id_section = self.find_definition(tree, "id")
             if id_section:
                 # Find the associated <ul> tag containing the ID
-                ul_tag = id_section.find_next_sibling('dd').find(
-                    'ul', rel="http://www.essepuntato.it/2010/06/literalreification/hasLiteralValue"
-                )
+                ul_tag = id_section.css_first('ul[rel="http://www.essepuntato.it/2010/06/literalreification/hasLiteralValue"]')
                 if ul_tag:
                     # Extract the text inside the first <li> tag
-                    li_tag = ul_tag.find('li')
+                    li_tag = ul_tag.css_first('li')
                     if li_tag:
-                        return li_tag.get_text(strip=True)  # Return the text content of the <li> tag
+                        return li_tag.text(strip=True)  # Return the text content of the <li> tag
         except Exception as e:
             # Log errors encountered while accessing the identifier URL
             print(f"Error accessing {identifier_url}: {e}")
         return None
 
-    def process_journals(self):
+    def process_journal(self, journal_url):
         """
-        Process each journal URL to extract identifiers and associated IDs.
+        Extract the identifiers of a journal and their associated IDs.
 
         """
-        for journal_url in tqdm(self.journal_urls, desc="Processing journals"):
-            # Skip processing if the URL is empty or invalid
-            if not isinstance(journal_url, str) or not journal_url.strip():
-                continue
+        journal_results = []  # List for storing results for the current journal
+
+        # Get all identifier URLs from the current journal page
+        journal_identifiers = self.get_identifiers_from_journal(journal_url)
+
+        # Process each identifier URL found in the journal page
+        for identifier_url in journal_identifiers:
+            retrieved_id = self.get_id_from_identifier_page(identifier_url)  # Extract the ID from the identifier page
+            if retrieved_id:
+                # Append the identifier URL and its associated ID to the results
+                journal_results.append({
+                    "identifier_url": identifier_url,
+                    "id": retrieved_id
+                })
+        return journal_results
 
-            # Get all identifier URLs from the current journal page
-            journal_identifiers = self.get_identifiers_from_journal(journal_url)
-            self.results[journal_url] = []  # Initialize an empty list for storing results for the current journal
+    def process_journals(self):
+        """
+        Process each journal URL to extract identifiers and associated IDs.
 
-            # Process each identifier URL found in the journal page
-            for identifier_url in journal_identifiers:
-                retrieved_id = self.get_id_from_identifier_page(identifier_url)  # Extract the ID from the identifier page
-                if retrieved_id:
-                    # Append the identifier URL and its associated ID to the results
-                    self.results[journal_url].append({
-                        "identifier_url": identifier_url,
-                        "id": retrieved_id
-                    })
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Journals are processed concurrently, the results are returned in the same order as the URLs
+            journal_results = executor.map(self.process_journal, self.journal_urls)
+            for journal_url, results in tqdm(zip(self.journal_urls, journal_results), desc="Processing journals", total=len(self.journal_urls)):
+                self.results[journal_url] = results
 
     def save_results(self):
         """
         Save the extracted results to the specified JSON file.
         """
         try:
-            with open(self.output_path, 'w', encoding='utf-8') as json_file:
+            with open(self.output_path, 'wb') as json_file:
                 # Write the results dictionary to the JSON file in a human-readable format
-                json.dump(self.results, json_file, indent=4)
+                json_file.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
             print(f"Data saved to {self.output_path}")
         except Exception as e:
             print(f"Error saving results: {e}")
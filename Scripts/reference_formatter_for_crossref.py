@@ -10,6 +10,11 @@
 
 import json
 import re
+from multiprocessing import Pool
+
+# Patterns to match PMID and DOI, compiled once for all the references
+_PMID_RE = re.compile(r'\bPMID[:\s]?(\d+)\b')
+_DOI_RE = re.compile(r'(10\.\d{4,9}/[^\s:,\);]+)(?=PMID|$)')
 
 class ReferenceProcessor:
     """
@@ -17,13 +22,15 @@ class ReferenceProcessor:
     It can extract DOI, PMID, or title from references and optionally remove titles from the processed data.
     """
 
-    def __init__(self, input_file, output_file):
+    def __init__(self, input_file, output_file, processes=None):
         """
         Initialize the ReferenceProcessor with input and output file paths.
+        The references are processed by the given number of processes, one per CPU by default.
 
         """
         self.input_file = input_file
         self.output_file = output_file
+        self.processes = processes
 
     @staticmethod
     def extract_reference_info(reference):
@@ -31,16 +38,12 @@ class ReferenceProcessor:
         Extract DOI, PMID, or title from a reference string.
 
         """
-        # Patterns to match PMID and DOI
-        pmid_pattern = r'\bPMID[:\s]?(\d+)\b'
-        doi_pattern = r'(10\.\d{4,9}/[^\s:,\);]+)(?=PMID|$)'
-
         # Extract PMID
-        pmid_match = re.search(pmid_pattern, reference)
+        pmid_match = _PMID_RE.search(reference)
         pmid = pmid_match.group(1) if pmid_match else None
 
         # Extract DOI
-        doi_match = re.search(doi_pattern, reference)
+        doi_match = _DOI_RE.search(reference)
         doi = doi_match.group(0) if doi_match else None
 
         # Extract title if DOI and PMID are not found
@@ -66,15 +69,12 @@ class ReferenceProcessor:
         with open(self.input_file, 'r', encoding="utf-8") as f:
             data = json.load(f)
 
-        # Process each entry and extract reference information
-        for entry in data.values():
-            updated_references = []
-            for ref in entry.get("references", []):
-                ref_info = self.extract_reference_info(ref)
-                updated_references.append(ref_info)
-
-            # Update the references in the entry
-            entry["references"] = updated_references
+        # Process the entries in parallel and extract reference information
+        entries_references = ((key, entry.get("references", [])) for key, entry in data.items())
+        with Pool(self.processes) as pool:
+            for key, updated_references in pool.imap_unordered(_process_entry_references, entries_references, chunksize=64):
+                # Update the references in the entry
+                data[key]["references"] = updated_references
 
         # Save the updated JSON data to the output file
         with open(self.output_file, 'w', encoding="utf-8") as f:
@@ -116,6 +116,15 @@ class ReferenceProcessor:
     #     print(f"Finalized JSON data saved to {final_output_file}")
 
 
+def _process_entry_references(key_and_references):
+    """
+    Extract the information of all the references of an entry, in a worker process.
+
+    """
+    key, references = key_and_references
+    return key, [ReferenceProcessor.extract_reference_info(ref) for ref in references]
+
+
 # Main script execution
 if __name__ == "__main__":
     # File paths
@@ -8,12 +8,33 @@
 # OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT,
 # NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import re
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml.etree import ParserError
 import urllib3
 import PyPDF2
+import pypdfium2 as pdfium
 import io
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http_utils import create_session, METADATA_CACHE_EXPIRATION
+from io_utils import JSONArrayWriter
+from html_utils import parse_html, get_text, class_xpath
+
+# XPath expressions compiled once and reused for every page
+TITLE_XPATH = etree.XPath(f"//h1[{class_xpath('page_title')}]")
+LI_XPATH = etree.XPath("//li")
+NAME_XPATH = etree.XPath(f".//span[{class_xpath('name')}]")
+AFFILIATION_XPATH = etree.XPath(f".//span[{class_xpath('affiliation')}]")
+BOLD_XPATH = etree.XPath("//b")
+# Paragraphs of the first references section
+REFERENCES_XPATH = etree.XPath("(//section[normalize-space(@class)='item references'])[1]//p")
+# Start of the references in the text of a PDF, matched in any case without lowercasing a copy of the text
+REFERENCES_HEADING_RE = re.compile("references", re.IGNORECASE)
+
+# PDFium is not thread-safe, so only one thread at a time can open a PDF and extract its text
+PDFIUM_LOCK = threading.Lock()
 
 # Disable SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -25,8 +46,10 @@ class DOIProcessor:
     A class to process DOIs, extract metadata from HTML or PDF content, and save the results as JSON.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=8, cache_name="http_cache"):
         self.doi_base_url = "https://doi.org/"  # Base URL for constructing DOI links
+        self.max_workers = max_workers  # Maximum number of DOIs processed concurrently
+        self.session = create_session(pool_maxsize=max_workers, cache_name=cache_name, expire_after=METADATA_CACHE_EXPIRATION)
 
     def get_content_from_doi(self, doi_url):
         """
@@ -34,14 +57,14 @@ class DOIProcessor:
 
         """
         try:
-            response = requests.get(doi_url, verify=False)
+            response = self.session.get(doi_url, verify=False)
             response.raise_for_status()
 
             content_type = response.headers.get('Content-Type')
             if 'application/pdf' in content_type:
                 return 'pdf', response.content
             else:
-                return 'html', response.text
+                return 'html', response.content
         except requests.exceptions.HTTPError as err:
             print(f"HTTP error occurred for {doi_url}: {err}")
         except Exception as err:
@@ -53,46 +76,78 @@ class DOIProcessor:
         Extract metadata from HTML content.
 
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
+        try:
+            tree = parse_html(html_content)
+        except ParserError:
+            # The page has no markup to parse
+            return "No title found", "", "", []
 
         # Extract title
-        title_tag = soup.find('h1', class_='page_title')
-        title = title_tag.get_text(strip=True) if title_tag else "No title found"
+        title_tags = TITLE_XPATH(tree)
+        title = get_text(title_tags[0]) if title_tags else "No title found"
 
         # Extract authors and affiliations
         authors = []
-        author_list = soup.find_all('li')
-        for author in author_list:
-            name = author.find('span', class_='name').get_text(strip=True) if author.find('span', class_='name') else "No name"
-            affiliation = author.find('span', class_='affiliation').get_text(strip=True) if author.find('span', class_='affiliation') else "No affiliation"
+        for author in LI_XPATH(tree):
+            name_tags = NAME_XPATH(author)
+            affiliation_tags = AFFILIATION_XPATH(author)
+            name = get_text(name_tags[0]) if name_tags else "No name"
+            affiliation = get_text(affiliation_tags[0]) if affiliation_tags else "No affiliation"
             authors.append(f"{name} ({affiliation})")
 
         # Extract bold text
-        bold_texts = [bold.get_text(strip=True) for bold in soup.find_all('b')]
+        bold_texts = [get_text(bold) for bold in BOLD_XPATH(tree)]
 
         # Extract references
         references = []
-        reference_section = soup.find('section', class_='item references')
-        if reference_section:
-            reference_paragraphs = reference_section.find_all('p')
-            for ref in reference_paragraphs:
-                ref_text = ref.get_text(strip=True).split('\n')  # Split references based on new lines
-                references.extend(ref_text)  # Extend the list with each reference
+        for ref in REFERENCES_XPATH(tree):
+            ref_text = get_text(ref).split('\n')  # Split references based on new lines
+            references.extend(ref_text)  # Extend the list with each reference
 
         # Return extracted information
         return title, ', '.join(authors), ', '.join(bold_texts), [ref.strip() for ref in references if ref.strip()]
 
     def extract_text_from_pdf(self, pdf_content):
         """
-        Extract text from PDF content.
+        Extract text from PDF content with PDFium, falling back to PyPDF2 for the files PDFium can't read.
+        The PDFium calls are serialized by PDFIUM_LOCK, since the DOIs are processed by several threads.
+
+        """
+        with PDFIUM_LOCK:
+            try:
+                pdf = pdfium.PdfDocument(pdf_content)
+            except pdfium.PdfiumError as e:
+                error = f"PDFium could not open the PDF, falling back to PyPDF2: {e}"
+            else:
+                try:
+                    pages_text = []
+                    for i in range(len(pdf)):
+                        page = pdf[i]
+                        textpage = page.get_textpage()
+                        try:
+                            pages_text.append(textpage.get_text_range())
+                        finally:
+                            # Release each page before loading the next one
+                            textpage.close()
+                            page.close()
+                    return "\n".join(pages_text)
+                except pdfium.PdfiumError as e:
+                    error = f"PDFium could not extract the text, falling back to PyPDF2: {e}"
+                finally:
+                    pdf.close()
+
+        # PyPDF2 is pure Python, so the fallback runs outside the lock
+        print(error)
+        return self.extract_text_from_pdf_with_pypdf2(pdf_content)
+
+    def extract_text_from_pdf_with_pypdf2(self, pdf_content):
+        """
+        Extract text from PDF content with PyPDF2.
 
         """
-        text = ""
         try:
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-            return text
+            return "".join(page.extract_text() or "" for page in pdf_reader.pages)
         except Exception as e:
             print(f"Error while extracting text from PDF: {e}")
             return None
@@ -102,9 +157,9 @@ class DOIProcessor:
         Extract references from the text of a PDF document.
 
         """
-        refs_start = text.lower().find("references")
-        if refs_start != -1:
-            return text[refs_start:]  # Return text starting from "References"
+        refs_match = REFERENCES_HEADING_RE.search(text)
+        if refs_match:
+            return text[refs_match.start():]  # Return text starting from "References"
         return "No references found in PDF"
 
     def process_doi(self, doi):
@@ -131,33 +186,31 @@ class DOIProcessor:
     def process_dois_and_save_to_json(self, dois, output_file):
         """
         Process a list of DOIs and save the extracted metadata to a JSON file.
+        The metadata of each DOI is written as soon as it is extracted.
 
         """
-        all_metadata = []
-
-        for doi in dois:
-            title, authors, bold_text, ref_text = self.process_doi(doi)
-
-            # Debug print statements
-            print(f"DOI: {doi}")
-            print(f"  Title: {title}")
-            print(f"  Authors: {authors}")
-            print(f"  Bold Text: {bold_text}")
-            print(f"  Reference Text: {ref_text}")
-
-            metadata = {
-                'DOI': doi,
-                'Title': title,
-                'Authors': authors,
-                'Bold Text': bold_text,
-                'Reference Text': ref_text
-            }
-
-            all_metadata.append(metadata)
-
-        # Save to JSON
-        with open(output_file, 'w', encoding='utf-8') as jsonfile:
-            json.dump(all_metadata, jsonfile, ensure_ascii=False, indent=4)
+        # Each DOI is processed once, keeping the input order
+        dois = list(dict.fromkeys(dois))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, JSONArrayWriter(output_file) as json_writer:
+            # DOIs are processed concurrently, the results are returned in the same order as the DOIs
+            for doi, (title, authors, bold_text, ref_text) in zip(dois, executor.map(self.process_doi, dois)):
+                # Debug print statements
+                print(f"DOI: {doi}")
+                print(f"  Title: {title}")
+                print(f"  Authors: {authors}")
+                print(f"  Bold Text: {bold_text}")
+                print(f"  Reference Text: {ref_text}")
+
+                metadata = {
+                    'DOI': doi,
+                    'Title': title,
+                    'Authors': authors,
+                    'Bold Text': bold_text,
+                    'Reference Text': ref_text
+                }
+
+                json_writer.write(metadata)
 
         print(f"Data saved to {output_file}")
 